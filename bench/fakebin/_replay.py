@@ -0,0 +1,53 @@
+"""Shared helpers for the fake system tools used by the benchmark harness.
+
+Each fake tool replays a recorded transcript from ``bench/transcripts``.
+Transcripts are JSON lines of ``{"delay": seconds, "data": text}`` where
+``delay`` is the time that passed before ``data`` was written in the
+original recording.  ``BENCH_REPLAY_SPEED`` scales those delays
+(2 = twice as fast, 0 = no delay at all).
+"""
+import json
+import os
+import sys
+import time
+
+TRANSCRIPT_DIR = os.environ.get(
+    'BENCH_TRANSCRIPT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'transcripts')
+)
+
+
+def replay_speed():
+    try:
+        return float(os.environ.get('BENCH_REPLAY_SPEED', '1'))
+    except ValueError:
+        return 1.0
+
+
+def transcript_path(name):
+    return os.path.join(TRANSCRIPT_DIR, name)
+
+
+def replay(name, stream=None):
+    """Write the transcript ``name`` to ``stream`` honouring recorded delays."""
+    stream = stream or sys.stdout
+    speed = replay_speed()
+    with open(transcript_path(name), 'r', encoding='utf-8') as f:
+        for raw in f:
+            raw = raw.strip()
+            if not raw:
+                continue
+            record = json.loads(raw)
+            delay = record.get('delay', 0)
+            if speed > 0 and delay > 0:
+                time.sleep(delay / speed)
+            stream.write(record.get('data', ''))
+            stream.flush()
+
+
+def cat(name, stream=None):
+    """Write a static fixture (e.g. a JSON document) without delays."""
+    stream = stream or sys.stdout
+    with open(transcript_path(name), 'r', encoding='utf-8') as f:
+        stream.write(f.read())
+    stream.flush()
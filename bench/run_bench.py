@@ -0,0 +1,373 @@
+"""Replay-based benchmark for the installer server.
+
+Starts ``server.py`` (through ``bench/serve.py``) with fake ``lsblk``,
+``blockdev``, ``iwlist``, ``pacman`` and ``archinstall`` executables first
+on ``PATH``.  The fakes replay recorded transcripts from
+``bench/transcripts`` so a full install runs through the real
+``api_install``/``read_pty_output`` path without touching any disk.
+
+While the replayed install runs, a number of simulated browser clients
+behave like ``Install.html``: load the disk and timezone lists, then poll
+``/api/install/logs``.  Per-endpoint latencies and the CPU/memory usage
+of the server process are written as JSON so runs can be compared:
+
+    python bench/run_bench.py --output before.json
+    python bench/run_bench.py --output after.json --baseline before.json
+    python bench/run_bench.py --compare before.json after.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import psutil
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKEBIN_DIR = os.path.join(BENCH_DIR, 'fakebin')
+SCHEMA_VERSION = 1
+
+# Metrics compared by --baseline/--compare; larger is worse for all of them.
+COMPARED_ENDPOINT_METRICS = ('p50_ms', 'p99_ms')
+COMPARED_SERVER_METRICS = ('cpu_seconds', 'rss_max_bytes')
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class LatencyRecorder:
+    """Thread-safe collection of request latencies grouped by endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            if ok:
+                self.samples.setdefault(endpoint, []).append(seconds * 1000.0)
+            else:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+                self.samples.setdefault(endpoint, [])
+
+    def summary(self):
+        result = {}
+        with self._lock:
+            for endpoint, values in sorted(self.samples.items()):
+                values = sorted(values)
+                result[endpoint] = {
+                    'count': len(values),
+                    'errors': self.errors.get(endpoint, 0),
+                    'p50_ms': _round(percentile(values, 50)),
+                    'p99_ms': _round(percentile(values, 99)),
+                    'mean_ms': _round(sum(values) / len(values)) if values else None,
+                    'max_ms': _round(values[-1]) if values else None,
+                }
+        return result
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU and RSS of the server process at a fixed interval."""
+
+    def __init__(self, pid, interval):
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.cpu_percent = []
+        self.rss = []
+        self.cpu_seconds = 0.0
+        self.num_threads_max = 0
+
+    def run(self):
+        self.process.cpu_percent(None)
+        while not self.stop_event.wait(self.interval):
+            try:
+                with self.process.oneshot():
+                    self.cpu_percent.append(self.process.cpu_percent(None))
+                    self.rss.append(self.process.memory_info().rss)
+                    times = self.process.cpu_times()
+                    self.cpu_seconds = times.user + times.system
+                    self.num_threads_max = max(self.num_threads_max, self.process.num_threads())
+            except psutil.Error:
+                break
+
+    def summary(self):
+        return {
+            'cpu_seconds': _round(self.cpu_seconds, 3),
+            'cpu_percent_avg': _round(sum(self.cpu_percent) / len(self.cpu_percent)) if self.cpu_percent else None,
+            'cpu_percent_max': _round(max(self.cpu_percent)) if self.cpu_percent else None,
+            'rss_max_bytes': max(self.rss) if self.rss else None,
+            'rss_last_bytes': self.rss[-1] if self.rss else None,
+            'threads_max': self.num_threads_max,
+            'samples': len(self.rss),
+        }
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def timed_request(base_url, path, recorder, endpoint=None, method='GET', body=None, timeout=30):
+    """Issue one request and record its latency; returns parsed JSON or None."""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = resp.read()
+        ok = True
+    except (urllib.error.URLError, OSError):
+        payload = None
+        ok = False
+    recorder.record(endpoint or path, time.perf_counter() - start, ok)
+    if payload is None:
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def browser_client(base_url, recorder, stop_event, poll_interval, reload_every, seed):
+    """Mimic Install.html: load disks/timezones/network status, then poll the install log."""
+    rng = random.Random(seed)
+    polls = 0
+    while not stop_event.is_set():
+        if polls % reload_every == 0:
+            timed_request(base_url, '/api/disks', recorder)
+            regions = timed_request(base_url, '/api/timezones', recorder) or {}
+            region_list = regions.get('regions') or ['Europe']
+            timed_request(base_url, f'/api/timezones/{rng.choice(region_list)}', recorder,
+                          endpoint='/api/timezones/<region>')
+            # renderNetworkOptions(); scans with the fake iwlist when the host has a wireless interface
+            timed_request(base_url, '/api/network/status', recorder)
+        timed_request(base_url, '/api/install/logs', recorder)
+        polls += 1
+        stop_event.wait(poll_interval)
+
+
+def install_payload(device):
+    """The request body Install.html sends for a default single-disk install."""
+    return {
+        'archinstall-language': 'en',
+        'timezone': 'Europe/Berlin',
+        'kb_layout': 'us',
+        'user': {'username': 'bench', 'password': 'bench'},
+        'disk_config': {
+            'config_type': 'default_layout',
+            'device_modifications': [{'device': device, 'wipe': True}],
+        },
+        'filesystem': 'ext4',
+    }
+
+
+def wait_for_server(base_url, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited early with code {process.returncode}')
+        try:
+            with urllib.request.urlopen(base_url + '/api/timezones', timeout=1):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.1)
+    raise RuntimeError(f'server did not become ready within {timeout}s')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       universal_newlines=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    port = args.port or free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ)
+    env['PATH'] = FAKEBIN_DIR + os.pathsep + env.get('PATH', '')
+    env['BENCH_REPLAY_SPEED'] = str(args.replay_speed)
+    env['PYTHONUNBUFFERED'] = '1'
+    # Keep job directories, mount points and the package cache out of the real system
+    scratch_dir = tempfile.mkdtemp(prefix='boxos-bench-')
+    env['BOXOS_JOBS_DIR'] = os.path.join(scratch_dir, 'jobs')
+    env['BOXOS_MOUNT_ROOT'] = os.path.join(scratch_dir, 'mnt')
+    env['BOXOS_PKG_CACHE'] = os.path.join(scratch_dir, 'pkg')
+    env['BOXOS_PACMAN_MIRRORLIST'] = os.path.join(scratch_dir, 'mirrorlist')
+    env['BOXOS_LOG_DIR'] = os.path.join(scratch_dir, 'logs')
+
+    server_log = args.server_log or os.path.join(tempfile.gettempdir(), 'bench_server.log')
+    with open(server_log, 'w') as log_file:
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, 'serve.py'), '--port', str(port)],
+            env=env, stdout=log_file, stderr=subprocess.STDOUT,
+        )
+    try:
+        wait_for_server(base_url, server, args.startup_timeout)
+        recorder = LatencyRecorder()
+        sampler = ProcessSampler(server.pid, args.sample_interval)
+        sampler.start()
+
+        started = time.perf_counter()
+        installs = [
+            timed_request(base_url, '/api/install', recorder, method='POST',
+                          body=install_payload(device), timeout=60)
+            for device in args.device
+        ]
+
+        stop_event = threading.Event()
+        clients = [
+            threading.Thread(target=browser_client, daemon=True,
+                             args=(base_url, recorder, stop_event, args.poll_interval,
+                                   args.reload_every, i))
+            for i in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        stop_event.wait(args.duration)
+        stop_event.set()
+        for client in clients:
+            client.join(timeout=30)
+        elapsed = time.perf_counter() - started
+        jobs = timed_request(base_url, '/api/install/jobs', recorder) or {}
+        metrics = timed_request(base_url, '/api/metrics', recorder) or {}
+        sampler.stop_event.set()
+        sampler.join(timeout=5)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return {
+        'schema_version': SCHEMA_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': git_revision(),
+        'params': {
+            'clients': args.clients,
+            'duration_s': args.duration,
+            'poll_interval_s': args.poll_interval,
+            'reload_every': args.reload_every,
+            'replay_speed': args.replay_speed,
+            'devices': args.device,
+        },
+        'elapsed_s': _round(elapsed, 3),
+        'installs': installs,
+        'jobs': jobs.get('jobs', []),
+        'metrics': metrics,
+        'endpoints': recorder.summary(),
+        'server': sampler.summary(),
+    }
+
+
+def compare(baseline, current, threshold):
+    """Return human readable regressions of ``current`` relative to ``baseline``."""
+    regressions = []
+
+    def check(label, old, new):
+        if old is None or new is None or old <= 0:
+            return
+        if new > old * (1.0 + threshold):
+            regressions.append(f'{label}: {old} -> {new} (+{(new / old - 1.0) * 100:.0f}%)')
+
+    for endpoint, old_stats in baseline.get('endpoints', {}).items():
+        new_stats = current.get('endpoints', {}).get(endpoint)
+        if new_stats is None:
+            continue
+        for metric in COMPARED_ENDPOINT_METRICS:
+            check(f'{endpoint} {metric}', old_stats.get(metric), new_stats.get(metric))
+    for metric in COMPARED_SERVER_METRICS:
+        check(f'server {metric}', baseline.get('server', {}).get(metric),
+              current.get('server', {}).get(metric))
+    return regressions
+
+
+def print_summary(result):
+    print(f"{'endpoint':<28}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"{endpoint:<28}{stats['count']:>8}{stats['errors']:>8}"
+              f"{str(stats['p50_ms']):>10}{str(stats['p99_ms']):>10}")
+    server = result['server']
+    print(f"server: cpu {server['cpu_seconds']}s (avg {server['cpu_percent_avg']}%, "
+          f"max {server['cpu_percent_max']}%), rss max {server['rss_max_bytes']} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8, help='simulated browser clients')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to run the clients')
+    parser.add_argument('--poll-interval', type=float, default=0.5,
+                        help='seconds between /api/install/logs polls (Install.html uses 0.5)')
+    parser.add_argument('--reload-every', type=int, default=20,
+                        help='re-fetch disks/timezones every N log polls')
+    parser.add_argument('--replay-speed', type=float, default=10.0,
+                        help='transcript speed multiplier, 0 replays without delays')
+    parser.add_argument('--device', action='append',
+                        help='target disk from the lsblk fixture; repeat for parallel installs (default: /dev/vda)')
+    parser.add_argument('--port', type=int, default=0, help='server port (default: pick a free one)')
+    parser.add_argument('--sample-interval', type=float, default=0.25, help='CPU/RSS sampling interval')
+    parser.add_argument('--startup-timeout', type=float, default=30.0)
+    parser.add_argument('--server-log', help='file for server stdout/stderr')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='results JSON to compare this run against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative increase reported as a regression (0.25 = 25%%)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='only compare two existing result files')
+    args = parser.parse_args()
+    args.device = args.device or ['/dev/vda']
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print_summary(current)
+        print(f'results written to {args.output}')
+        if not args.baseline:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    if not regressions:
+        print('no regressions')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""Run the installer server for benchmarking.
+
+``server.py`` starts Flask in debug mode with the reloader, which forks a
+child process and makes the measured PID meaningless.  This wrapper runs
+the very same ``app`` single-process, threaded, without the reloader.
+"""
+import argparse
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    # server.py serves Install.html and locales/ relative to the CWD
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+    import server
+
+    server.app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Download telemetry parsed from pacman output.
+
+pacman redraws one progress line per package while downloading, e.g.::
+
+     linux-6.10.arch1-1-x86_64   80.5 MiB  10.2 MiB/s 00:04 [#####-----]  40%
+     Total ( 3/90)              512.3 MiB  20.1 MiB/s 00:21 [##--------]  12%
+
+DownloadTracker turns those redraws (separated by ``\\r`` on a TTY) into
+per-package and total byte counters.  Throughput is estimated from our
+own samples over a rolling window rather than trusting pacman's
+per-file rate, so a slow mirror shows up in the total rate and ETA.
+
+A job runs pacman in stages (the shared-cache prefetch, then archinstall's
+pacstrap) that list the same packages, so bytes are counted once per
+package and expected sizes are kept per stage instead of adding up.
+Packages a stage copies from a local cache (pacstrap reading the shared
+prefetch cache through ``file://``) are counted as cache-served bytes,
+not as mirror downloads, so they cannot inflate the throughput.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+from install_log import ANSI_PATTERN
+
+UNIT_BYTES = {
+    'B': 1,
+    'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4,
+    'kB': 1000, 'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4,
+}
+_SIZE = r'(\d+(?:\.\d+)?)\s+([KMGT]?i?B)'
+_PROGRESS_TAIL = _SIZE + r'\s+' + _SIZE + r'/s\s+([\d:-]+)\s+\[[^\]]*\]\s+(\d+)%'
+PACKAGE_PROGRESS_PATTERN = re.compile(r'^\s*(\S+)\s+' + _PROGRESS_TAIL)
+TOTAL_PROGRESS_PATTERN = re.compile(r'^\s*Total\s+\(\s*(\d+)/(\d+)\)\s+' + _PROGRESS_TAIL)
+TOTAL_DOWNLOAD_SIZE_PATTERN = re.compile(r'^\s*Total Download Size:\s+' + _SIZE)
+DOWNLOADING_PATTERN = re.compile(r'^\s*(\S+) downloading\.\.\.')
+DATABASE_SYNC_MARKER = ':: Synchronizing package databases'
+PACKAGE_PHASE_MARKERS = (':: Retrieving packages', 'resolving dependencies')
+
+THROUGHPUT_WINDOW = 10.0 # seconds of samples behind the rolling throughput
+
+
+def to_bytes(value, unit):
+    return int(float(value) * UNIT_BYTES.get(unit, 1))
+
+
+def parse_eta(text):
+    """Converts pacman's ``MM:SS`` / ``HH:MM:SS`` ETA to seconds (None for ``--:--``)."""
+    try:
+        seconds = 0
+        for part in text.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+class DownloadTracker:
+    """Accumulates pacman download progress for one install job."""
+
+    def __init__(self, window=THROUGHPUT_WINDOW, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._window = window
+        self._partial = ''
+        self._syncing_databases = False # repo databases are not packages
+        self.packages = {}       # name -> {'bytes', 'total_bytes', 'percent', 'reported_rate_bps', 'done'}
+        self.cache_served = {}   # name -> bytes copied from a local package cache
+        self._is_cached = None   # the current stage's is_cached callable
+        self._stage_sources = {} # name -> True if the current stage copies it from the cache
+        self.current_package = None
+        self.stage = None
+        self._expected = {}      # stage -> sum of "Total Download Size" over its transactions
+        self.pacman_total = None # latest "Total (i/n)" line
+        self._samples = deque()  # (time, downloaded_bytes)
+        self._last_progress_at = None
+        self._started_at = None
+
+    @property
+    def expected_bytes(self):
+        return max(self._expected.values(), default=0)
+
+    # --- parsing ---
+    def start_stage(self, stage, is_cached=None):
+        """Marks the start of another pacman run (e.g. ``'prefetch'``, then ``'install'``).
+
+        ``is_cached(name)`` tells whether this run copies a package from a
+        local cache instead of downloading it from a mirror.
+        """
+        with self._lock:
+            self.stage = stage
+            self._partial = ''
+            self._syncing_databases = False
+            self._is_cached = is_cached
+            self._stage_sources = {}
+
+    def feed(self, text):
+        """Accepts raw terminal output in arbitrary chunks."""
+        with self._lock:
+            self._partial += text
+            *segments, self._partial = re.split(r'[\r\n]', self._partial)
+            for segment in segments:
+                self._parse_segment(ANSI_PATTERN.sub('', segment))
+
+    def _parse_segment(self, segment):
+        if not segment.strip():
+            return
+        if DATABASE_SYNC_MARKER in segment:
+            self._syncing_databases = True
+            return
+        if any(marker in segment for marker in PACKAGE_PHASE_MARKERS):
+            self._syncing_databases = False
+            return
+        if self._syncing_databases:
+            return
+        match = TOTAL_PROGRESS_PATTERN.match(segment)
+        if match:
+            index, count, size, unit, rate, rate_unit, eta, percent = match.groups()
+            self.pacman_total = {
+                'index': int(index), 'count': int(count), 'bytes': to_bytes(size, unit),
+                'reported_rate_bps': to_bytes(rate, rate_unit), 'eta_seconds': parse_eta(eta),
+                'percent': int(percent),
+            }
+            return
+        match = PACKAGE_PROGRESS_PATTERN.match(segment)
+        if match:
+            name, size, unit, rate, rate_unit, eta, percent = match.groups()
+            self._update_package(name, to_bytes(size, unit), int(percent), to_bytes(rate, rate_unit))
+            return
+        match = TOTAL_DOWNLOAD_SIZE_PATTERN.match(segment)
+        if match:
+            self._expected[self.stage] = self._expected.get(self.stage, 0) + to_bytes(*match.groups())
+            return
+        match = DOWNLOADING_PATTERN.match(segment)
+        if match:
+            # Non-TTY output (and database syncs) only announce the file
+            self.packages.setdefault(match.group(1), self._new_package())
+            self.current_package = match.group(1)
+
+    @staticmethod
+    def _new_package():
+        return {'bytes': 0, 'total_bytes': None, 'percent': 0, 'reported_rate_bps': None, 'done': False}
+
+    def _update_package(self, name, downloaded, percent, reported_rate):
+        now = self._clock()
+        cached = self._stage_sources.get(name)
+        if cached is None:
+            cached = self._stage_sources[name] = bool(self._is_cached and self._is_cached(name))
+        if cached:
+            self.cache_served[name] = max(self.cache_served.get(name, 0), downloaded)
+            self.current_package = name
+            return
+        package = self.packages.setdefault(name, self._new_package())
+        if downloaded > package['bytes']:
+            self._last_progress_at = now
+        package['bytes'] = max(package['bytes'], downloaded)
+        package['percent'] = percent
+        package['reported_rate_bps'] = reported_rate
+        if percent > 0:
+            # pacman shows bytes transferred so far; the size follows from the percentage
+            package['total_bytes'] = int(downloaded * 100 / percent)
+        package['done'] = percent >= 100
+        self.current_package = name
+        if self._started_at is None:
+            self._started_at = now
+        self._samples.append((now, self._downloaded_bytes()))
+        # Keep one sample from before the window as the baseline
+        while len(self._samples) > 2 and now - self._samples[1][0] > self._window:
+            self._samples.popleft()
+
+    # --- results ---
+    def _downloaded_bytes(self):
+        return sum(p['bytes'] for p in self.packages.values())
+
+    def _throughput(self, now):
+        if len(self._samples) < 2:
+            return None
+        (t0, b0), (_, b1) = self._samples[0], self._samples[-1]
+        # Measure up to now, not the last sample, so a stalled mirror drags the rate down
+        if now - t0 <= 0:
+            return None
+        return (b1 - b0) / (now - t0)
+
+    def snapshot(self, include_packages=False):
+        """JSON-serialisable view of the counters and throughput estimate."""
+        with self._lock:
+            now = self._clock()
+            downloaded = self._downloaded_bytes()
+            throughput = self._throughput(now)
+            remaining = max(self.expected_bytes - downloaded, 0) if self.expected_bytes else None
+            eta = None
+            if remaining is not None and throughput:
+                eta = round(remaining / throughput, 1)
+            result = {
+                'stage': self.stage,
+                'downloaded_bytes': downloaded,
+                'expected_bytes': self.expected_bytes or None,
+                'throughput_bps': round(throughput) if throughput is not None else None,
+                'eta_seconds': eta,
+                'packages_seen': len(self.packages),
+                'packages_completed': sum(1 for p in self.packages.values() if p['done']),
+                'cache_served_bytes': sum(self.cache_served.values()),
+                'cache_served_packages': len(self.cache_served),
+                'current_package': self.current_package,
+                'pacman_total': dict(self.pacman_total) if self.pacman_total else None,
+                'elapsed_seconds': round(now - self._started_at, 1) if self._started_at is not None else None,
+                # A large value while downloading points at a stalled mirror
+                'seconds_since_progress': round(now - self._last_progress_at, 1) if self._last_progress_at is not None else None,
+            }
+            if include_packages:
+                result['packages'] = {name: dict(p) for name, p in self.packages.items()}
+            return result
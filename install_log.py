@@ -0,0 +1,284 @@
+"""Structured, indexed install log.
+
+Every install run writes ``<run_id>.jsonl`` (one JSON object per line with
+``ts``, ``source``, ``level``, ``phase`` and ``message``) plus a sidecar
+``<run_id>.idx``.  The index holds one fixed-size record per log line
+(timestamp, byte offset, level code, phase code), so tail, time-range and
+level/phase queries only read the small index and then seek straight to
+the matching lines instead of scanning the whole log.
+
+Log files are never deleted by the server, so past runs stay available
+for troubleshooting.
+"""
+import bisect
+import glob
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+# ts (float64), byte offset (uint64), level code (uint8), phase code (uint8)
+INDEX_RECORD = struct.Struct('<dQBB')
+
+LEVELS = ('debug', 'info', 'warning', 'error')
+SOURCES = ('pty', 'preflight', 'post-install', 'server')
+PHASES = (
+    'unknown', 'prefetch', 'partitioning', 'formatting', 'mounting', 'mirrors',
+    'base-install', 'packages', 'hooks', 'configuration', 'bootloader', 'users',
+    'post-install', 'done',
+)
+
+# archinstall/pacman output that marks the start of a phase (checked in order)
+PHASE_MARKERS = (
+    ('post_install_config.sh', 'post-install'),
+    ('Executing post-install', 'post-install'),
+    ('Installation completed', 'done'),
+    ('Creating partition layout', 'partitioning'),
+    ('Wiping partitions', 'partitioning'),
+    ('Formatting ', 'formatting'),
+    ('Mounting ', 'mounting'),
+    ('Updating pacman database', 'mirrors'),
+    ('Synchronizing package databases', 'mirrors'),
+    ('Installing essential packages', 'base-install'),
+    ('Installing packages', 'packages'),
+    ('Running post-transaction hooks', 'hooks'),
+    ('Configuring timezone', 'configuration'),
+    ('Generating locales', 'configuration'),
+    ('Setting keyboard layout', 'configuration'),
+    ('Setting hostname', 'configuration'),
+    ('Installing bootloader', 'bootloader'),
+    ('Generating grub configuration', 'bootloader'),
+    ('Enabling service', 'users'),
+    ('Creating user', 'users'),
+)
+
+# Whole words only: package and file names such as libgpg-error, perl-error
+# or /usr/include/error.h show up in every pacman transaction
+_WORD_START = r'(?<![\w./-])'
+_WORD_END = r'(?![\w-]|\.\w)'
+ERROR_PATTERN = re.compile(_WORD_START + r'(error|errors|failed|failure|fatal|traceback)' + _WORD_END, re.IGNORECASE)
+# e.g. grub-install's "No error reported." or archinstall's "completed without any errors"
+NO_ERROR_PATTERN = re.compile(r'\bno errors?\b|\bwithout (any )?errors?\b', re.IGNORECASE)
+WARNING_PATTERN = re.compile(_WORD_START + r'(warn|warning)' + _WORD_END, re.IGNORECASE)
+RUN_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+# Colour codes, cursor movement and other CSI/OSC sequences pacman emits on a TTY
+ANSI_PATTERN = re.compile(r'\x1b(\[[0-9;?]*[A-Za-z]|\][^\x07]*\x07)')
+
+
+def guess_level(message):
+    """Infers a log level from a line of installer output."""
+    if ERROR_PATTERN.search(message) and not NO_ERROR_PATTERN.search(message):
+        return 'error'
+    if WARNING_PATTERN.search(message):
+        return 'warning'
+    return 'info'
+
+
+def clean_terminal_line(line):
+    """Strips escape sequences and keeps only what a terminal shows after the last ``\\r``."""
+    line = ANSI_PATTERN.sub('', line)
+    if '\r' in line:
+        segments = [s for s in line.split('\r') if s.strip()]
+        line = segments[-1] if segments else ''
+    return line.rstrip()
+
+
+def _code(values, value, default=0):
+    try:
+        return values.index(value)
+    except ValueError:
+        return default
+
+
+class StructuredLog:
+    """Appends JSON lines to ``<log_dir>/<run_id>.jsonl`` and keeps its index up to date."""
+
+    def __init__(self, log_dir, run_id):
+        os.makedirs(log_dir, exist_ok=True)
+        self.run_id = run_id
+        self.path = os.path.join(log_dir, f"{run_id}.jsonl")
+        self.index_path = os.path.join(log_dir, f"{run_id}.idx")
+        self.phase = 'unknown'
+        self._last_ts = 0.0
+        self._lock = threading.Lock()
+        self._partial = ''
+        self._log_file = open(self.path, 'ab')
+        self._log_file.seek(0, os.SEEK_END)
+        self._index_file = open(self.index_path, 'ab')
+
+    def write(self, message, source='pty', level=None, phase=None):
+        """Appends one entry; level and phase are inferred from the text when not given."""
+        message = message.rstrip('\r\n')
+        with self._lock:
+            if phase is None:
+                for marker, marker_phase in PHASE_MARKERS:
+                    if marker in message:
+                        self.phase = marker_phase
+                        break
+                phase = self.phase
+            else:
+                self.phase = phase
+            if source == 'pty' and phase == 'post-install':
+                source = 'post-install'
+            level = level or guess_level(message)
+            # Keep timestamps sorted for the index even if NTP steps the clock back mid-install
+            self._last_ts = max(time.time(), self._last_ts)
+            entry = {'ts': self._last_ts, 'source': source, 'level': level, 'phase': phase, 'message': message}
+            data = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+            offset = self._log_file.tell()
+            self._log_file.write(data)
+            # Flush the line before its index record so readers never seek to unwritten data
+            self._log_file.flush()
+            self._index_file.write(INDEX_RECORD.pack(entry['ts'], offset, _code(LEVELS, level, 1), _code(PHASES, phase)))
+            self._index_file.flush()
+
+    def feed(self, text, source='pty', phase=None):
+        """Accepts raw terminal output in arbitrary chunks and logs each completed line."""
+        self._partial += text
+        *lines, self._partial = self._partial.split('\n')
+        for line in lines:
+            line = clean_terminal_line(line)
+            if line:
+                self.write(line, source=source, phase=phase)
+
+    def flush(self, source='pty', phase=None):
+        """Logs a trailing line that was fed without a newline (e.g. when a process exits)."""
+        line = clean_terminal_line(self._partial)
+        self._partial = ''
+        if line:
+            self.write(line, source=source, phase=phase)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._log_file.close()
+            self._index_file.close()
+
+
+class _IndexTimestamps:
+    """Sequence view of the index timestamps that reads single records on demand."""
+
+    def __init__(self, index_file, count):
+        self.index_file = index_file
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        self.index_file.seek(i * INDEX_RECORD.size)
+        return INDEX_RECORD.unpack(self.index_file.read(INDEX_RECORD.size))[0]
+
+
+class LogReader:
+    """Index-backed queries over one run's structured log."""
+
+    def __init__(self, log_dir, run_id):
+        if not RUN_ID_PATTERN.match(run_id):
+            raise FileNotFoundError(f"Invalid run id '{run_id}'")
+        self.path = os.path.join(log_dir, f"{run_id}.jsonl")
+        self.index_path = os.path.join(log_dir, f"{run_id}.idx")
+        if not os.path.exists(self.path) or not os.path.exists(self.index_path):
+            raise FileNotFoundError(f"No structured log for run '{run_id}'")
+
+    def __len__(self):
+        # Ignore a record that is still being written
+        return os.path.getsize(self.index_path) // INDEX_RECORD.size
+
+    def _records(self, index_file, start, stop):
+        index_file.seek(start * INDEX_RECORD.size)
+        data = index_file.read((stop - start) * INDEX_RECORD.size)
+        return [INDEX_RECORD.unpack_from(data, i) for i in range(0, len(data) - INDEX_RECORD.size + 1, INDEX_RECORD.size)]
+
+    def _bisect_time(self, index_file, count, ts):
+        """First record position with timestamp >= ts (binary search over the index file)."""
+        return bisect.bisect_left(_IndexTimestamps(index_file, count), ts)
+
+    def query(self, tail=None, since=None, until=None, levels=None, phases=None, limit=1000):
+        """Returns matching entries in log order.
+
+        ``tail`` keeps only the last N matches, otherwise the first ``limit``
+        matches are returned.
+        """
+        level_codes = {_code(LEVELS, l, -1) for l in levels} if levels else None
+        phase_codes = {_code(PHASES, p, -1) for p in phases} if phases else None
+        wanted = tail if tail is not None else limit
+        if wanted is not None and wanted <= 0:
+            return []
+        count = len(self)
+        offsets = []
+        with open(self.index_path, 'rb') as index_file:
+            start = self._bisect_time(index_file, count, since) if since is not None else 0
+            stop = self._bisect_time(index_file, count, until) if until is not None else count
+
+            def matches(record):
+                return ((level_codes is None or record[2] in level_codes) and
+                        (phase_codes is None or record[3] in phase_codes))
+
+            chunk = 4096
+            if tail is not None:
+                # Walk the index backwards until enough matches are found
+                pos = stop
+                while pos > start and len(offsets) < wanted:
+                    lo = max(start, pos - chunk)
+                    for record in reversed(self._records(index_file, lo, pos)):
+                        if matches(record):
+                            offsets.append(record[1])
+                            if len(offsets) >= wanted:
+                                break
+                    pos = lo
+                offsets.reverse()
+            else:
+                pos = start
+                while pos < stop and (wanted is None or len(offsets) < wanted):
+                    hi = min(stop, pos + chunk)
+                    for record in self._records(index_file, pos, hi):
+                        if matches(record):
+                            offsets.append(record[1])
+                            if wanted is not None and len(offsets) >= wanted:
+                                break
+                    pos = hi
+
+        entries = []
+        with open(self.path, 'rb') as log_file:
+            for offset in offsets:
+                log_file.seek(offset)
+                line = log_file.readline()
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+
+def list_runs(log_dir):
+    """Describes every run with a structured log in ``log_dir``, newest first."""
+    runs = []
+    for path in glob.glob(os.path.join(log_dir, '*.jsonl')):
+        run_id = os.path.basename(path)[:-len('.jsonl')]
+        index_path = os.path.join(log_dir, f"{run_id}.idx")
+        try:
+            stat = os.stat(path)
+            entries = os.path.getsize(index_path) // INDEX_RECORD.size if os.path.exists(index_path) else 0
+        except OSError:
+            continue
+        runs.append({'run_id': run_id, 'size_bytes': stat.st_size, 'entries': entries, 'modified_at': stat.st_mtime})
+    runs.sort(key=lambda r: r['modified_at'], reverse=True)
+    return runs
+
+
+def tail_text_file(path, n, block_size=8192):
+    """Returns the last ``n`` lines of a plain text file by reading backwards from the end."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b''
+        while pos > 0 and data.count(b'\n') <= n:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return lines[-n:] if n > 0 else []
@@ -0,0 +1,408 @@
+"""Network interface state and configuration for the installer server.
+
+Link and IPv4/IPv6 address state is kept in memory and updated from
+rtnetlink multicast events (RTM_NEWLINK/DELLINK/NEWADDR/DELADDR), so
+status queries never have to re-read every interface.  On systems without
+netlink (e.g. the Windows development stub) the state is re-read through
+psutil on every call instead.
+
+Static addresses are configured with acknowledged rtnetlink requests
+(RTM_DELADDR/NEWLINK/NEWADDR/NEWROUTE) on the same message layout, so
+every kernel error comes back as a NetworkConfigError.  DHCP runs in a
+background thread with a lease timeout; callers poll its state.
+"""
+import errno
+import ipaddress
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+import psutil
+
+# --- rtnetlink constants (linux/netlink.h, linux/rtnetlink.h, linux/if_addr.h) ---
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWLINK, RTM_DELLINK = 16, 17
+RTM_NEWADDR, RTM_DELADDR, RTM_GETADDR = 20, 21, 22
+RTM_NEWROUTE = 24
+NLMSG_ERROR, NLMSG_DONE, NLMSG_OVERRUN = 2, 3, 4
+NLM_F_REQUEST, NLM_F_ACK = 0x1, 0x4
+NLM_F_REPLACE, NLM_F_EXCL, NLM_F_CREATE, NLM_F_DUMP = 0x100, 0x200, 0x400, 0x300
+IFLA_IFNAME = 3
+IFA_ADDRESS, IFA_LOCAL, IFA_BROADCAST = 1, 2, 4
+RTA_OIF, RTA_GATEWAY = 4, 5
+IFF_UP, IFF_RUNNING = 0x1, 0x40
+RT_TABLE_MAIN, RTPROT_BOOT, RT_SCOPE_UNIVERSE, RTN_UNICAST = 254, 3, 0, 1
+
+NLMSGHDR = struct.Struct('=IHHII')   # len, type, flags, seq, pid
+NLMSGERR = struct.Struct('=i')       # error (negative errno, 0 for an ack)
+IFINFOMSG = struct.Struct('=BxHiII') # family, type, index, flags, change
+IFADDRMSG = struct.Struct('=BBBBI')  # family, prefixlen, flags, scope, index
+RTMSG = struct.Struct('=BBBBBBBBI')  # family, dst_len, src_len, tos, table, protocol, scope, type, flags
+RTATTR = struct.Struct('=HH')        # len, type
+
+DEFAULT_DHCP_TIMEOUT = 30
+
+
+class NetworkConfigError(Exception):
+    """Raised when an interface cannot be configured; the message is safe to show to the user."""
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _parse_rtattrs(data, offset):
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _pack_rtattr(attr_type, value):
+    length = RTATTR.size + len(value)
+    return RTATTR.pack(length, attr_type) + value + b'\0' * (_align(length) - length)
+
+
+class _RouteSocket:
+    """Request/response rtnetlink socket used to change interface configuration."""
+
+    def __init__(self):
+        try:
+            self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            self._socket.bind((0, 0))
+        except (AttributeError, OSError) as e:
+            raise NetworkConfigError(f"rtnetlink unavailable: {e}")
+        self._seq = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._socket.close()
+
+    def _send(self, msg_type, flags, body, attrs=()):
+        self._seq += 1
+        payload = body + b''.join(_pack_rtattr(attr_type, value) for attr_type, value in attrs)
+        self._socket.send(NLMSGHDR.pack(NLMSGHDR.size + len(payload), msg_type, NLM_F_REQUEST | flags, self._seq, 0) + payload)
+        return self._seq
+
+    def _replies(self, seq):
+        """Yields ``(type, body)`` replies to request ``seq`` until its ack or NLMSG_DONE."""
+        while True:
+            data = self._socket.recv(65536)
+            offset = 0
+            while offset + NLMSGHDR.size <= len(data):
+                msg_len, msg_type, _, msg_seq, _ = NLMSGHDR.unpack_from(data, offset)
+                if msg_len < NLMSGHDR.size:
+                    break
+                body = data[offset + NLMSGHDR.size:offset + msg_len]
+                offset += _align(msg_len)
+                if msg_seq != seq:
+                    continue
+                if msg_type in (NLMSG_ERROR, NLMSG_DONE):
+                    error = NLMSGERR.unpack_from(body)[0] if len(body) >= NLMSGERR.size else 0
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return
+                yield msg_type, body
+
+    def request(self, msg_type, flags, body, attrs=()):
+        """Sends one request and waits for the kernel's ack; raises OSError with its errno."""
+        for _ in self._replies(self._send(msg_type, NLM_F_ACK | flags, body, attrs)):
+            pass
+
+    def dump(self, msg_type, body):
+        """Returns every ``(type, body)`` of a dump request."""
+        return list(self._replies(self._send(msg_type, NLM_F_DUMP, body)))
+
+
+class NetworkState:
+    """In-memory view of interfaces, kept current by a netlink listener thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._interfaces = {} # name -> {'index', 'isup', 'running', 'ipv4': set(), 'ipv6': set()}
+        self._names = {}      # ifindex -> name
+        self._socket = None
+        self._thread = None
+        self.live = False     # True while netlink events keep the state current
+
+    # --- lifecycle ---
+    def start(self):
+        """Subscribes to rtnetlink events, then takes an initial snapshot."""
+        if self._thread is not None:
+            return
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        except (AttributeError, OSError) as e:
+            print(f"WARN: rtnetlink unavailable ({e}), network status will be polled.")
+            return
+        self._socket = sock
+        # Subscribe before the snapshot so no change between the two is lost
+        self._load_snapshot()
+        self.live = True
+        self._thread = threading.Thread(target=self._listen, name='netlink-monitor', daemon=True)
+        self._thread.start()
+
+    def _load_snapshot(self):
+        stats = psutil.net_if_stats()
+        addrs = psutil.net_if_addrs()
+        try:
+            indexes = {name: index for index, name in socket.if_nameindex()}
+        except (AttributeError, OSError):
+            indexes = {}
+        interfaces = {}
+        for name, stat in stats.items():
+            entry = {'index': indexes.get(name), 'isup': stat.isup, 'running': stat.isup, 'ipv4': set(), 'ipv6': set()}
+            for addr in addrs.get(name, []):
+                if addr.family not in (socket.AF_INET, socket.AF_INET6) or not addr.netmask:
+                    continue
+                try:
+                    netmask = addr.netmask
+                    if addr.family == socket.AF_INET6:
+                        # psutil reports IPv6 masks as addresses; ipaddress wants a prefix length
+                        netmask = bin(int(ipaddress.IPv6Address(netmask))).count('1')
+                    iface = ipaddress.ip_interface(f"{addr.address.split('%')[0]}/{netmask}")
+                except ValueError:
+                    continue
+                entry['ipv4' if addr.family == socket.AF_INET else 'ipv6'].add(str(iface))
+            interfaces[name] = entry
+        with self._lock:
+            self._interfaces = interfaces
+            self._names = {entry['index']: name for name, entry in interfaces.items() if entry['index'] is not None}
+
+    # --- netlink event handling ---
+    def _listen(self):
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS: # events were dropped, resynchronise
+                    print("WARN: netlink buffer overrun, reloading network state.")
+                    self._load_snapshot()
+                    continue
+                print(f"ERROR: netlink monitor stopped: {e}")
+                self.live = False
+                return
+            try:
+                self._handle_messages(data)
+            except Exception as e:
+                print(f"ERROR: Failed to parse netlink message: {e}")
+
+    def _handle_messages(self, data):
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            msg_len, msg_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+            if msg_len < NLMSGHDR.size:
+                break
+            body = data[offset + NLMSGHDR.size:offset + msg_len]
+            if msg_type == NLMSG_OVERRUN:
+                self._load_snapshot()
+            elif msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                self._handle_link(msg_type, body)
+            elif msg_type in (RTM_NEWADDR, RTM_DELADDR):
+                self._handle_addr(msg_type, body)
+            offset += _align(msg_len)
+
+    def _handle_link(self, msg_type, body):
+        _, _, index, flags, _ = IFINFOMSG.unpack_from(body)
+        attrs = _parse_rtattrs(body, IFINFOMSG.size)
+        name = attrs.get(IFLA_IFNAME, b'').rstrip(b'\0').decode('utf-8', errors='replace')
+        with self._lock:
+            name = name or self._names.get(index)
+            if not name:
+                return
+            if msg_type == RTM_DELLINK:
+                self._interfaces.pop(name, None)
+                self._names.pop(index, None)
+                return
+            old_name = self._names.get(index)
+            if old_name and old_name != name:
+                # Interface renamed (e.g. eth0 -> enp1s0 by udev)
+                self._interfaces[name] = self._interfaces.pop(old_name, None) or {}
+            entry = self._interfaces.setdefault(name, {'ipv4': set(), 'ipv6': set()})
+            entry.setdefault('ipv4', set())
+            entry.setdefault('ipv6', set())
+            # Same meaning as psutil's isup in the snapshot (IFF_RUNNING, i.e. carrier):
+            # an unplugged cable reports the interface as down although IFF_UP stays set
+            running = bool(flags & IFF_RUNNING)
+            entry.update({'index': index, 'isup': running, 'running': running})
+            self._names[index] = name
+
+    def _handle_addr(self, msg_type, body):
+        family, prefixlen, _, _, index = IFADDRMSG.unpack_from(body)
+        if family not in (socket.AF_INET, socket.AF_INET6):
+            return
+        attrs = _parse_rtattrs(body, IFADDRMSG.size)
+        # IFA_LOCAL is the interface's own address on point-to-point links
+        raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+        if not raw:
+            return
+        address = f"{socket.inet_ntop(family, raw)}/{prefixlen}"
+        key = 'ipv4' if family == socket.AF_INET else 'ipv6'
+        with self._lock:
+            name = self._names.get(index)
+            entry = self._interfaces.get(name) if name else None
+            if entry is None:
+                return
+            if msg_type == RTM_NEWADDR:
+                entry[key].add(address)
+            else:
+                entry[key].discard(address)
+
+    # --- queries ---
+    def interfaces(self):
+        """Returns ``{name: {'isup', 'running', 'ipv4': [...], 'ipv6': [...]}}``."""
+        if not self.live:
+            self._load_snapshot()
+        with self._lock:
+            return {
+                name: {
+                    'index': entry.get('index'),
+                    'isup': entry.get('isup', False),
+                    'running': entry.get('running', False),
+                    'ipv4': sorted(entry.get('ipv4', ())),
+                    'ipv6': sorted(entry.get('ipv6', ())),
+                }
+                for name, entry in self._interfaces.items()
+            }
+
+    def has_interface(self, name):
+        return name in self.interfaces()
+
+
+# --- Configuration ---
+def parse_static_config(cfg):
+    """Validates address/netmask/gateway from the UI; netmask may be a prefix length or dotted quad."""
+    try:
+        iface = ipaddress.IPv4Interface(f"{cfg.get('address')}/{cfg.get('netmask')}")
+    except (ipaddress.AddressValueError, ipaddress.NetmaskValueError, ValueError) as e:
+        raise NetworkConfigError(f"Invalid address/netmask: {e}")
+    gateway = cfg.get('gateway')
+    if gateway:
+        try:
+            gateway = ipaddress.IPv4Address(gateway)
+        except ipaddress.AddressValueError as e:
+            raise NetworkConfigError(f"Invalid gateway: {e}")
+        if gateway not in iface.network:
+            raise NetworkConfigError(f"Gateway {gateway} is not in {iface.network}")
+    return iface, gateway
+
+
+def configure_static(ifname, cfg):
+    """Replaces the IPv4 addresses of ``ifname`` with a static address and default route."""
+    iface, gateway = parse_static_config(cfg)
+    try:
+        index = socket.if_nametoindex(ifname)
+    except OSError:
+        raise NetworkConfigError(f"Interface {ifname} not found")
+    address = iface.ip.packed
+    with _RouteSocket() as rtnl:
+        step = 'flush addresses of'
+        try:
+            for _, body in rtnl.dump(RTM_GETADDR, IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)):
+                family, prefixlen, _, scope, addr_index = IFADDRMSG.unpack_from(body)
+                if addr_index != index:
+                    continue
+                attrs = _parse_rtattrs(body, IFADDRMSG.size)
+                try:
+                    rtnl.request(RTM_DELADDR, 0, IFADDRMSG.pack(family, prefixlen, 0, scope, index),
+                                 [(t, attrs[t]) for t in (IFA_LOCAL, IFA_ADDRESS) if t in attrs])
+                except OSError as e:
+                    # Secondary addresses go away together with their primary
+                    if e.errno != errno.EADDRNOTAVAIL:
+                        raise
+
+            step = 'bring up'
+            rtnl.request(RTM_NEWLINK, 0, IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, IFF_UP, IFF_UP))
+
+            step = f'add {iface.with_prefixlen} to'
+            attrs = [(IFA_LOCAL, address), (IFA_ADDRESS, address)]
+            if iface.network.prefixlen < 31:
+                attrs.append((IFA_BROADCAST, iface.network.broadcast_address.packed))
+            rtnl.request(RTM_NEWADDR, NLM_F_CREATE | NLM_F_EXCL,
+                         IFADDRMSG.pack(socket.AF_INET, iface.network.prefixlen, 0, RT_SCOPE_UNIVERSE, index), attrs)
+
+            if gateway:
+                step = f'set default route via {gateway} on'
+                # replace, not add: reconfiguring must not fail because a default route exists
+                rtnl.request(RTM_NEWROUTE, NLM_F_CREATE | NLM_F_REPLACE,
+                             RTMSG.pack(socket.AF_INET, 0, 0, 0, RT_TABLE_MAIN, RTPROT_BOOT, RT_SCOPE_UNIVERSE, RTN_UNICAST, 0),
+                             [(RTA_GATEWAY, gateway.packed), (RTA_OIF, struct.pack('=I', index))])
+        except OSError as e:
+            raise NetworkConfigError(f"Failed to {step} {ifname}: {e.strerror or e}")
+
+
+class DhcpManager:
+    """Runs one DHCP client per interface in the background with a lease timeout."""
+
+    def __init__(self, state):
+        self.state = state
+        self._lock = threading.Lock()
+        self._requests = {} # ifname -> request dict
+
+    def _client_command(self, ifname, timeout):
+        if shutil.which('dhclient'):
+            return ['dhclient', '-1', ifname] # -1: try once, fail instead of retrying forever
+        if shutil.which('dhcpcd'):
+            return ['dhcpcd', '-1', '-4', '-t', str(timeout), ifname]
+        return None
+
+    def start(self, ifname, timeout=DEFAULT_DHCP_TIMEOUT):
+        """Starts DHCP on ``ifname`` unless it is already running; returns the request status."""
+        try:
+            timeout = int(timeout)
+        except (TypeError, ValueError):
+            raise NetworkConfigError(f"Invalid DHCP timeout '{timeout}'")
+        if timeout <= 0:
+            raise NetworkConfigError("DHCP timeout must be positive")
+        with self._lock:
+            current = self._requests.get(ifname)
+            if current and current['state'] == 'running':
+                return dict(current)
+            command = self._client_command(ifname, timeout)
+            if command is None:
+                raise NetworkConfigError("No DHCP client (dhclient or dhcpcd) found")
+            request = {
+                'interface': ifname, 'state': 'running', 'client': command[0], 'timeout': timeout,
+                'started_at': time.time(), 'finished_at': None, 'error': None, 'addresses': [],
+            }
+            self._requests[ifname] = request
+        threading.Thread(target=self._run, args=(request, command), name=f'dhcp-{ifname}', daemon=True).start()
+        return dict(request)
+
+    def _run(self, request, command):
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=request['timeout'])
+            if result.returncode == 0:
+                request['state'] = 'bound'
+            else:
+                request['state'] = 'failed'
+                request['error'] = (result.stderr or result.stdout or '').strip()[-500:] or f"exit code {result.returncode}"
+        except subprocess.TimeoutExpired:
+            request['state'] = 'timeout'
+            request['error'] = f"No lease within {request['timeout']}s"
+        except Exception as e:
+            request['state'] = 'failed'
+            request['error'] = str(e)
+        finally:
+            request['finished_at'] = time.time()
+            request['addresses'] = self.state.interfaces().get(request['interface'], {}).get('ipv4', [])
+            print(f"DEBUG: DHCP on {request['interface']} finished: {request['state']} {request['error'] or ''}")
+
+    def status(self, ifname):
+        with self._lock:
+            request = self._requests.get(ifname)
+            return dict(request) if request else None
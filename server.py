@@ -19,21 +19,23 @@ if archinstall:
 else:
     # stub for Windows/development mode
     DISK_DEVICES = []
-import psutil
 import os
+import glob
 from threading import Thread
 import json
 import subprocess
-import socket
 import re
-from collections import deque
 import time
 import logging
 import secrets # Import secrets for random password generation
 import string # Import string for character sets
 import pty # Import pty for pseudo-terminal
 import select # Needed for checking pty readability
+import signal # Interrupt the package prefetch of a cancelled job
 import threading # For the reader thread
+import install_log # Structured, indexed install logs
+import network_manager # Netlink-backed interface state and configuration
+import download_progress # Byte counters and throughput parsed from pacman output
 
 # --- Archinstall Library Imports ---
 try:
@@ -52,11 +54,37 @@ logging.basicConfig(level=logging.DEBUG)
 print("DEBUG: starting server.py in debug mode")
 app = Flask(__name__, static_folder='.', static_url_path='')
 
-# --- Global state for installation process ---
-# Store PID and thread to potentially manage later
-install_process_info = {'pid': None, 'thread': None}
-progress_file_path = '/tmp/archinstall_progress.json'
-stderr_log_path = '/tmp/archinstall_stderr.log'
+# --- Global state for installation jobs ---
+# Every install runs as its own job (one per target disk) with a private
+# working directory and mount point, so several disks can be imaged at once.
+install_jobs = {} # job_id -> job dict (see create_install_job)
+install_jobs_lock = threading.Lock()
+latest_job_id = None # Job served by the legacy /api/install/logs endpoint
+jobs_root_dir = os.environ.get('BOXOS_JOBS_DIR', '/tmp/archinstall-jobs')
+mount_root_dir = os.environ.get('BOXOS_MOUNT_ROOT', '/mnt')
+# Packages are downloaded once into this cache and served to every job's
+# pacstrap through a pacman CacheServer entry in the mirrorlist.
+package_cache_dir = os.environ.get('BOXOS_PKG_CACHE', '/var/cache/boxos/pkg')
+pacman_mirrorlist_path = os.environ.get('BOXOS_PACMAN_MIRRORLIST', '/etc/pacman.d/mirrorlist')
+cache_server_comment = '# Shared BoxOS installer package cache'
+# The entry is only in the host mirrorlist while jobs use it; the original
+# file is restored when the last job finishes.
+cache_server_state = {'users': 0, 'original': None}
+cache_server_lock = threading.Lock()
+# The host pacman database can only be used by one pacman at a time
+pacman_lock = threading.Lock()
+keyring_state = {'updated': False}
+# Structured per-run logs (kept across runs for troubleshooting)
+install_log_dir = os.environ.get('BOXOS_LOG_DIR', '/var/log/boxos-installer')
+# Packages archinstall always pacstraps in addition to config["packages"]
+base_packages = ['base', 'linux', 'linux-firmware', 'grub', 'efibootmgr', 'networkmanager']
+# --------------------------------------------
+
+# --- Network state ---
+# Kept current by rtnetlink events instead of re-reading psutil on every request
+network_state = network_manager.NetworkState()
+network_state.start()
+dhcp_manager = network_manager.DhcpManager(network_state)
 # --------------------------------------------
 
 # In-memory buffer to store JSON progress messages - NOT USED with pty approach
@@ -100,20 +128,19 @@ def api_disks():
 
 @app.route('/api/network/status')
 def api_network_status():
-    # always gather interface stats and addresses before branching
-    stats = psutil.net_if_stats()
-    addrs = psutil.net_if_addrs()
+    # interface state comes from the in-memory netlink view
+    interfaces = network_state.interfaces()
     # Linux: check for active Ethernet
-    for iface, stat in stats.items():
+    for iface, info in interfaces.items():
         if iface == 'lo':
             continue
-        if (iface.startswith('en') or iface.startswith('eth')) and stat.isup:
+        if (iface.startswith('en') or iface.startswith('eth')) and info['isup']:
             # has IPv4 assigned?
-            if any(a.family == socket.AF_INET for a in addrs.get(iface, [])):
-                return jsonify({'connection_type': 'ethernet', 'interface': iface})
+            if info['ipv4']:
+                return jsonify({'connection_type': 'ethernet', 'interface': iface, 'addresses': info['ipv4']})
     # fallback to wireless
-    for iface, stat in stats.items():
-        if iface.startswith('w') and stat.isup:
+    for iface, info in interfaces.items():
+        if iface.startswith('w') and info['isup']:
             try:
                 scan = subprocess.check_output(['iwlist', iface, 'scan'], universal_newlines=True, stderr=subprocess.DEVNULL)
                 ssids = re.findall(r'ESSID:"([^\"]+)"', scan)
@@ -125,29 +152,50 @@ def api_network_status():
 
 @app.route('/api/network/config', methods=['POST'])
 def api_net_config():
-    data = request.json
+    """Configures an interface: DHCP runs in the background, static addresses are applied directly."""
+    data = request.json or {}
     iface = data.get('interface')
     method = data.get('method')
-    if method == 'dhcp':
-        os.system(f"dhclient {iface}")
-    elif method == 'static':
-        cfg = data.get('config', {})
-        ip = cfg.get('address')
-        mask = cfg.get('netmask')
-        gw = cfg.get('gateway')
-        os.system(f"ip addr flush dev {iface}")
-        os.system(f"ip addr add {ip}/{mask} dev {iface}")
-        os.system(f"ip route add default via {gw}")
-    return jsonify({'status':'ok'})
+    if not iface or not network_state.has_interface(iface):
+        return jsonify({'status': 'error', 'message': f"Unknown interface '{iface}'"}), 400
+    try:
+        if method == 'dhcp':
+            timeout = data.get('timeout', network_manager.DEFAULT_DHCP_TIMEOUT)
+            dhcp_status = dhcp_manager.start(iface, timeout=timeout)
+            # Poll /api/network/dhcp/<iface> for the lease
+            return jsonify({'status': 'pending', 'dhcp': dhcp_status}), 202
+        elif method == 'static':
+            network_manager.configure_static(iface, data.get('config', {}))
+        else:
+            return jsonify({'status': 'error', 'message': f"Unknown method '{method}'"}), 400
+    except network_manager.NetworkConfigError as e:
+        print(f"ERROR: Network configuration of {iface} failed: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        print(f"ERROR: Unexpected error configuring {iface}: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({'status':'ok', 'interface': network_state.interfaces().get(iface)})
+
+@app.route('/api/network/dhcp/<iface>')
+def api_network_dhcp_status(iface):
+    """State of the last DHCP request on an interface (running/bound/failed/timeout)."""
+    dhcp_status = dhcp_manager.status(iface)
+    if dhcp_status is None:
+        return jsonify({'error': f"No DHCP request for '{iface}'"}), 404
+    return jsonify(dhcp_status)
 
 # --- PTY Reader Thread Function ---
-def read_pty_output(master_fd, output_path, stderr_path):
-    """Reads from the master pty FD and writes to output files."""
+def read_pty_output(master_fd, output_path, stderr_path, structured_log=None, download_tracker=None,
+                    log_source='pty', log_phase=None):
+    """Reads from the master pty FD and writes to output files (and the structured log/download tracker, if given).
+
+    With ``output_path=None`` nothing is written to a progress file.
+    """
     print(f"DEBUG: Starting PTY reader thread for fd {master_fd}")
     try:
         # Open output files within the thread
         # Use line buffering (buffering=1) for text mode
-        progress_file = open(output_path, 'w', buffering=1, encoding='utf-8')
+        progress_file = open(output_path, 'w', buffering=1, encoding='utf-8') if output_path else None
         # stderr_file = open(stderr_path, 'w', buffering=1, encoding='utf-8') # Not directly captured via pty master
 
         while True:
@@ -171,7 +219,12 @@ def read_pty_output(master_fd, output_path, stderr_path):
                 # Decode assuming UTF-8, replace errors
                 text_output = data.decode('utf-8', errors='replace')
                 print(f"PTY RAW: {text_output.strip()}") # Log raw output for debugging
-                progress_file.write(text_output)
+                if progress_file:
+                    progress_file.write(text_output)
+                if structured_log:
+                    structured_log.feed(text_output, source=log_source, phase=log_phase)
+                if download_tracker:
+                    download_tracker.feed(text_output)
                 # Note: stderr is merged with stdout via PTY, so we don't write to stderr_file here.
                 # If separate stderr is needed, Popen needs separate pipes *before* pty.
 
@@ -182,7 +235,7 @@ def read_pty_output(master_fd, output_path, stderr_path):
         print(f"ERROR: Exception in PTY reader thread: {e}")
     finally:
         print(f"DEBUG: Closing files and PTY master fd {master_fd} in reader thread.")
-        if 'progress_file' in locals() and not progress_file.closed:
+        if 'progress_file' in locals() and progress_file and not progress_file.closed:
             progress_file.close()
         # if 'stderr_file' in locals() and not stderr_file.closed:
         #     stderr_file.close() # Close if we were using it
@@ -191,29 +244,306 @@ def read_pty_output(master_fd, output_path, stderr_path):
 
 # ---------------------------------
 
-@app.route('/api/install', methods=['POST'])
-def api_install():
-    """Receive installation config, write JSON files, and start archinstall guided script in a PTY."""
-    global install_process_info # Allow modification of global state
+# --- Install Job Helpers ---
+def create_install_job(device):
+    """Creates the working directory and mount point for a new install job."""
+    device_name = os.path.basename(device) if device else 'disk'
+    job_id = f"{device_name}-{secrets.token_hex(4)}"
+    work_dir = os.path.join(jobs_root_dir, job_id)
+    os.makedirs(work_dir, exist_ok=True)
+    return {
+        'id': job_id,
+        'device': device,
+        'work_dir': work_dir,
+        'mount_point': os.path.join(mount_root_dir, f"archinstall-{job_id}"),
+        'config_path': os.path.join(work_dir, 'archinstall_config.json'),
+        'creds_path': os.path.join(work_dir, 'archinstall_creds.json'),
+        'progress_path': os.path.join(work_dir, 'progress.log'),
+        'stderr_path': os.path.join(work_dir, 'stderr.log'),
+        'main_log_path': os.path.join(work_dir, 'archinstall_main.log'),
+        'state': 'preparing', # preparing -> downloading -> installing -> finished/failed/killed
+        'pid': None,
+        'prefetch_pid': None, # pacman -Sw, while the job is downloading
+        'thread': None,
+        'log': None, # install_log.StructuredLog, opened by run_install_job
+        'downloads': download_progress.DownloadTracker(),
+        'returncode': None,
+        'started_at': time.time(),
+        'finished_at': None,
+    }
+
+def job_summary(job):
+    """JSON-serialisable view of a job (drops thread objects and credentials)."""
+    return {
+        'job_id': job['id'],
+        'device': job['device'],
+        'state': job['state'],
+        'pid': job['pid'],
+        'returncode': job['returncode'],
+        'mount_point': job['mount_point'],
+        'work_dir': job['work_dir'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'downloads': job['downloads'].snapshot(),
+    }
 
-    # --- Stop existing installation if running ---
-    if install_process_info['pid'] is not None:
+def abandon_install_job(job):
+    """Marks a registered job that never got its thread as failed (keeps a killed state)."""
+    with install_jobs_lock:
+        if job['state'] != 'killed':
+            job['state'] = 'failed'
+        job['finished_at'] = time.time()
+
+def stop_install_job(job):
+    """Kills a running job (archinstall runs in its own session, so kill the group).
+
+    Must be called with install_jobs_lock held: run_install_job sets the pid
+    and state under the same lock, so neither can change between the check
+    and the kill.
+    """
+    pid = job.get('pid')
+    if pid is None:
+        if job['finished_at'] is None:
+            # Still preparing or prefetching; run_install_job checks this before each step
+            job['state'] = 'killed'
+            if job.get('prefetch_pid'):
+                # SIGINT, not SIGKILL: pacman then removes its db.lck before exiting
+                print(f"WARN: Stopping package prefetch of job {job['id']} (PID: {job['prefetch_pid']})")
+                try:
+                    os.killpg(job['prefetch_pid'], signal.SIGINT)
+                except OSError as kill_err:
+                    print(f"DEBUG: Prefetch of job {job['id']} already finished: {kill_err}")
+        return
+    try:
+        os.kill(pid, 0)
+        print(f"WARN: Killing installation job {job['id']} (PID: {pid})")
+        os.killpg(pid, 9) # SIGKILL
+        job['state'] = 'killed'
+    except OSError:
+        print(f"DEBUG: Install job {job['id']} (PID: {pid}) already finished.")
+    except Exception as kill_err:
+        print(f"ERROR: Failed to kill install job {job['id']} (PID: {pid}): {kill_err}")
+
+def cache_server_line():
+    return f"CacheServer = file://{package_cache_dir}"
+
+def strip_cache_server_entry(mirrorlist):
+    """Returns mirrorlist text without our CacheServer entry and its comment."""
+    ours = {cache_server_comment, cache_server_line()}
+    return ''.join(line for line in mirrorlist.splitlines(keepends=True) if line.rstrip('\n') not in ours)
+
+def remove_cache_server_entry(mirrorlist_path):
+    """Removes our CacheServer entry from a mirrorlist file, if present."""
+    try:
+        with open(mirrorlist_path, 'r') as f:
+            mirrorlist = f.read()
+        cleaned = strip_cache_server_entry(mirrorlist)
+        if cleaned != mirrorlist:
+            with open(mirrorlist_path, 'w') as f:
+                f.write(cleaned)
+            print(f"DEBUG: Removed shared package cache from {mirrorlist_path}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"ERROR: Failed to remove shared package cache from {mirrorlist_path}: {e}")
+
+def acquire_package_cache_server():
+    """Points pacman at the shared package cache so every job's pacstrap reuses it.
+
+    pacstrap downloads into the cache of the *target* system, so without this
+    each concurrent job would fetch every package again. Every call must be
+    paired with release_package_cache_server().
+    """
+    with cache_server_lock:
+        cache_server_state['users'] += 1
+        if cache_server_state['users'] > 1:
+            return
+        try:
+            with open(pacman_mirrorlist_path, 'r') as f:
+                # Strip a stale entry left behind if the server died mid-install
+                original = strip_cache_server_entry(f.read())
+            with open(pacman_mirrorlist_path, 'w') as f:
+                f.write(f"{cache_server_comment}\n{cache_server_line()}\n{original}")
+            cache_server_state['original'] = original
+            print(f"DEBUG: Added shared package cache to {pacman_mirrorlist_path}")
+        except FileNotFoundError:
+            print(f"WARN: {pacman_mirrorlist_path} not found, jobs will not share downloads.")
+        except Exception as e:
+            print(f"ERROR: Failed to register shared package cache: {e}")
+
+def release_package_cache_server():
+    """Restores the host mirrorlist once no job needs the shared cache entry any more."""
+    with cache_server_lock:
+        cache_server_state['users'] -= 1
+        if cache_server_state['users'] > 0 or cache_server_state['original'] is None:
+            return
         try:
-            # Check if the process actually exists
-            os.kill(install_process_info['pid'], 0)
-            print(f"WARN: Killing previous installation process (PID: {install_process_info['pid']})")
-            os.kill(install_process_info['pid'], 9) # SIGKILL
-            if install_process_info['thread'] and install_process_info['thread'].is_alive():
-                 # We might need a way to signal the thread to stop cleanly if possible
-                 print("WARN: Previous reader thread might still be running.")
-        except OSError:
-            print(f"DEBUG: Previous install process (PID: {install_process_info['pid']}) already finished.")
-        except Exception as kill_err:
-            print(f"ERROR: Failed to kill previous process {install_process_info['pid']}: {kill_err}")
+            with open(pacman_mirrorlist_path, 'w') as f:
+                f.write(cache_server_state['original'])
+            print(f"DEBUG: Restored {pacman_mirrorlist_path}")
+        except Exception as e:
+            print(f"ERROR: Failed to restore {pacman_mirrorlist_path}: {e}")
+        cache_server_state['original'] = None
+
+def package_in_shared_cache(name):
+    """True if ``name`` (as pacman shows it, e.g. ``linux-6.10.arch1-1-x86_64``) is in the shared cache."""
+    pattern = os.path.join(glob.escape(package_cache_dir), glob.escape(name) + '.pkg.tar*')
+    return any(not path.endswith(('.part', '.sig')) for path in glob.glob(pattern))
+
+def prefetch_packages(job, packages):
+    """Downloads packages into the shared cache; packages already cached are skipped by pacman.
+
+    pacman runs in a PTY so it prints its per-package progress bars, which
+    feed the job's download telemetry. Output only goes to the structured
+    log: the progress log drives the keyword-based progress bar in
+    Install.html and must only see archinstall.
+    """
+    structured_log = job['log']
+    os.makedirs(package_cache_dir, exist_ok=True)
+    prefetch_cmd = ['pacman', '-Sw', '--noconfirm', '--cachedir', package_cache_dir] + packages
+    # Hold the lock so a second job waits for the first download instead of
+    # fetching the same packages in parallel (and tripping over db.lck).
+    with pacman_lock:
+        master_fd, slave_fd = pty.openpty()
+        try:
+            prefetch = subprocess.Popen(prefetch_cmd, stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
+                                        close_fds=True, preexec_fn=os.setsid)
+        except FileNotFoundError:
+            os.close(master_fd)
+            print("WARN: pacman command not found, skipping package prefetch.")
+            structured_log.write("pacman not found, skipping package prefetch",
+                                 source='preflight', level='warning', phase='prefetch')
+            return
+        except Exception:
+            os.close(master_fd)
+            raise
         finally:
-            install_process_info['pid'] = None
-            install_process_info['thread'] = None
-    # --------------------------------------------
+            os.close(slave_fd)
+        # Let stop_install_job interrupt the download instead of holding pacman_lock
+        # (and the replacement job waiting on it) until every package is fetched
+        with install_jobs_lock:
+            job['prefetch_pid'] = prefetch.pid
+            if job['state'] == 'killed':
+                os.killpg(prefetch.pid, signal.SIGINT)
+        read_pty_output(master_fd, None, None, structured_log, job['downloads'],
+                        log_source='preflight', log_phase='prefetch')
+        structured_log.flush(source='preflight', phase='prefetch')
+        prefetch.wait()
+        with install_jobs_lock:
+            job['prefetch_pid'] = None
+        if job['state'] == 'killed':
+            structured_log.write("Package prefetch stopped, job was cancelled",
+                                 source='preflight', level='warning', phase='prefetch')
+        elif prefetch.returncode != 0:
+            # Not fatal: pacstrap simply downloads whatever is missing itself
+            print(f"WARN: Package prefetch failed (exit code {prefetch.returncode}), continuing without shared cache.")
+            structured_log.write(f"Package prefetch failed with exit code {prefetch.returncode}",
+                                 source='preflight', level='warning', phase='prefetch')
+
+def run_install_job(job, command, packages):
+    """Job thread: prefetch packages, run archinstall in a PTY and record the result."""
+    acquire_package_cache_server()
+    try:
+        job['log'] = install_log.StructuredLog(install_log_dir, job['id'])
+        job['log'].write(f"Install job for {job['device']} (mount point {job['mount_point']})",
+                         source='server', phase='prefetch')
+        with install_jobs_lock:
+            if job['state'] == 'killed':
+                return
+            job['state'] = 'downloading'
+        job['downloads'].start_stage('prefetch')
+        prefetch_packages(job, packages)
+        if job['state'] == 'killed':
+            return
+
+        job['downloads'].start_stage('install', is_cached=package_in_shared_cache)
+        # Create a pseudo-terminal (PTY)
+        master_fd, slave_fd = pty.openpty()
+        print(f"DEBUG: [{job['id']}] Opened PTY pair: master={master_fd}, slave={slave_fd}")
+        try:
+            # Start the archinstall process, connecting its std* to the slave PTY
+            # Use preexec_fn=os.setsid to run in a new session, making it easier to kill later if needed
+            process = subprocess.Popen(
+                command,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd, # Redirect stderr to slave PTY as well
+                close_fds=True, # Close other inherited file descriptors
+                universal_newlines=False, # Read/write bytes with PTY
+                preexec_fn=os.setsid # Run in a new session
+            )
+        except Exception:
+            os.close(master_fd)
+            raise
+        finally:
+            # Close the slave FD in the parent process, it's only needed by the child (archinstall)
+            os.close(slave_fd)
+        print(f"DEBUG: [{job['id']}] Started archinstall process with PID: {process.pid}")
+        with install_jobs_lock:
+            job['pid'] = process.pid
+            killed = job['state'] == 'killed'
+            if not killed:
+                job['state'] = 'installing'
+        if killed:
+            # Replaced while archinstall was being spawned, before the pid was known
+            print(f"WARN: [{job['id']}] Job was cancelled during startup, killing archinstall (PID: {process.pid})")
+            os.killpg(process.pid, 9)
+
+        job['log'].write(f"Started archinstall (PID {process.pid}): {' '.join(command)}", source='server', phase='unknown')
+
+        read_pty_output(master_fd, job['progress_path'], job['stderr_path'], job['log'], job['downloads'])
+        job['returncode'] = process.wait()
+        # pacstrap copied the host mirrorlist, CacheServer entry included; the
+        # post-install command strips it too, this covers a failed post-install.
+        remove_cache_server_entry(os.path.join(job['mount_point'], 'etc', 'pacman.d', 'mirrorlist'))
+        if job['state'] != 'killed':
+            job['state'] = 'finished' if job['returncode'] == 0 else 'failed'
+    except FileNotFoundError:
+        print(f"ERROR: [{job['id']}] archinstall command not found!")
+        if job['state'] != 'killed':
+            job['state'] = 'failed'
+    except Exception as e:
+        print(f"ERROR: [{job['id']}] Install job failed: {e}")
+        if job['state'] != 'killed':
+            job['state'] = 'failed'
+    finally:
+        release_package_cache_server()
+        job['finished_at'] = time.time()
+        print(f"DEBUG: [{job['id']}] Install job ended in state {job['state']} (returncode {job['returncode']}).")
+        if job['log']:
+            job['log'].write(f"Install job ended in state {job['state']} (returncode {job['returncode']})",
+                             source='server', level='info' if job['state'] == 'finished' else 'error')
+            job['log'].close()
+
+def read_progress_events(progress_path):
+    """Returns the raw progress lines of a job as simple message objects."""
+    events = []
+    try:
+        if os.path.exists(progress_path):
+            with open(progress_path, 'r', encoding='utf-8') as f:
+                 file_content = f.read()
+                 # Split content into lines
+                 raw_lines = file_content.strip().split('\n')
+                 for line in raw_lines:
+                      line = line.strip()
+                      if line:
+                          # Send back simple message objects
+                          events.append({'message': line})
+
+    except FileNotFoundError:
+        print(f"WARN: Progress file {progress_path} not found yet.")
+        events.append({'message': 'Installation starting, waiting for output...'})
+    except Exception as e:
+        print(f"ERROR: Could not read progress file {progress_path}: {e}")
+        events.append({'message': f'Error reading progress log: {e}'})
+    return events
+
+# ---------------------------------
+
+@app.route('/api/install', methods=['POST'])
+def api_install():
+    """Receive installation config, write JSON files, and start archinstall guided script in a PTY."""
+    global latest_job_id # Allow modification of global state
 
     raw_body = request.json
     print(f"DEBUG: raw request body: {raw_body}")
@@ -223,6 +553,32 @@ def api_install():
         print(f"ERROR: failed to parse JSON: {e}")
         data = {}
     print(f"DEBUG: parsed JSON data: {data}")
+
+    # --- Stop existing installation on the same disk if running ---
+    # Installs onto other disks keep running; a new request for a disk that
+    # already has a job replaces it (e.g. the user restarted the installer).
+    target_device = None
+    disk_mods = []
+    if isinstance(data.get("disk_config"), dict):
+        disk_mods = data["disk_config"].get("device_modifications") or []
+    if isinstance(disk_mods, list) and disk_mods and isinstance(disk_mods[0], dict):
+        target_device = disk_mods[0].get("device")
+    try:
+        job = create_install_job(target_device)
+    except Exception as e:
+        print(f"ERROR: Failed to create install job directory: {e}")
+        return jsonify({'status': 'error', 'message': f'Failed to create install job: {e}'}), 500
+    # Stop and register in one step, so two requests for the same disk cannot
+    # both pass the check while the keyring refresh below is still running.
+    with install_jobs_lock:
+        for other_job in install_jobs.values():
+            if other_job['device'] == target_device and other_job['finished_at'] is None:
+                stop_install_job(other_job)
+        install_jobs[job['id']] = job
+        latest_job_id = job['id']
+    print(f"DEBUG: Created install job {job['id']} in {job['work_dir']}")
+    # --------------------------------------------
+
     # map language codes to full language names for Archinstall
     lang_map = {
         "en": "English",
@@ -454,9 +810,11 @@ def api_install():
         },
         # --- Post-installation Script ---
         # Add the command to run our custom configuration script after installation
-        # Assuming the default mount point is /mnt/archinstall
+        # Each job mounts its target under its own mount point
         "post-install": [
-            f"arch-chroot /mnt/archinstall /root/post_install_config.sh {data.get('user', {}).get('username')} /home/{data.get('user', {}).get('username')}"
+            # pacstrap copies the host mirrorlist, including the shared cache entry
+            f"arch-chroot {job['mount_point']} sed -i -e '/^{cache_server_comment}$/d' -e '\\|^{cache_server_line()}$|d' /etc/pacman.d/mirrorlist",
+            f"arch-chroot {job['mount_point']} /root/post_install_config.sh {data.get('user', {}).get('username')} /home/{data.get('user', {}).get('username')}"
         ]
         # ----------------------------------
         # Passwords are moved to creds file
@@ -497,10 +855,9 @@ def api_install():
     print(f"DEBUG: final archinstall main config: {json.dumps(config, indent=2)}")
     print(f"DEBUG: final archinstall creds config: {json.dumps(creds_config, indent=2)}")
 
-    # save configs in the project root (Boxlinux folder)
-    project_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(project_dir, 'archinstall_config.json')
-    creds_path = os.path.join(project_dir, 'archinstall_creds.json') # Path for creds file
+    # save configs in the job's working directory
+    config_path = job['config_path']
+    creds_path = job['creds_path'] # Path for creds file
 
     try:
         with open(config_path, 'w') as f:
@@ -512,124 +869,162 @@ def api_install():
 
     except Exception as e:
          print(f"ERROR: Failed to write config/creds files: {e}")
+         abandon_install_job(job)
          return jsonify({'status': 'error', 'message': f'Failed to write configuration files: {e}'}), 500
 
     # --- Update Keyring ---
-    # Based on common archinstall/pacstrap issues, update keyring first
-    print("DEBUG: Attempting to update archlinux-keyring...")
-    try:
-        keyring_update_cmd = ['pacman', '-Sy', 'archlinux-keyring', '--noconfirm']
-        keyring_result = subprocess.run(keyring_update_cmd, check=True, capture_output=True, text=True)
-        print(f"DEBUG: Keyring update successful:\n{keyring_result.stdout}")
-    except subprocess.CalledProcessError as e:
-        print(f"ERROR: Failed to update archlinux-keyring: {e}")
-        print(f"ERROR STDOUT: {e.stdout}")
-        print(f"ERROR STDERR: {e.stderr}")
-        # Decide if this is fatal. It might be okay if keyring is recent enough,
-        # but it's often the cause of pacstrap failures. Return error for now.
-        return jsonify({"status": "error", "message": f"Failed to update archlinux-keyring: {e.stderr}"}), 500
-    except FileNotFoundError:
-        print("ERROR: pacman command not found. Cannot update keyring.")
-        # This is definitely fatal in the live environment
-        return jsonify({"status": "error", "message": "pacman command not found"}), 500
-    except Exception as e:
-        print(f"ERROR: An unexpected error occurred during keyring update: {e}")
-        return jsonify({"status": "error", "message": f"Unexpected error updating keyring: {e}"}), 500
+    # Based on common archinstall/pacstrap issues, update keyring first.
+    # Once per server run is enough; concurrent jobs share the host keyring.
+    # (Check before locking so a job busy prefetching does not block this request.)
+    if not keyring_state['updated']:
+        with pacman_lock:
+            if not keyring_state['updated']:
+                print("DEBUG: Attempting to update archlinux-keyring...")
+                try:
+                    keyring_update_cmd = ['pacman', '-Sy', 'archlinux-keyring', '--noconfirm']
+                    keyring_result = subprocess.run(keyring_update_cmd, check=True, capture_output=True, text=True)
+                    print(f"DEBUG: Keyring update successful:\n{keyring_result.stdout}")
+                    keyring_state['updated'] = True
+                except subprocess.CalledProcessError as e:
+                    print(f"ERROR: Failed to update archlinux-keyring: {e}")
+                    print(f"ERROR STDOUT: {e.stdout}")
+                    print(f"ERROR STDERR: {e.stderr}")
+                    # Decide if this is fatal. It might be okay if keyring is recent enough,
+                    # but it's often the cause of pacstrap failures. Return error for now.
+                    abandon_install_job(job)
+                    return jsonify({"status": "error", "message": f"Failed to update archlinux-keyring: {e.stderr}"}), 500
+                except FileNotFoundError:
+                    print("ERROR: pacman command not found. Cannot update keyring.")
+                    # This is definitely fatal in the live environment
+                    abandon_install_job(job)
+                    return jsonify({"status": "error", "message": "pacman command not found"}), 500
+                except Exception as e:
+                    print(f"ERROR: An unexpected error occurred during keyring update: {e}")
+                    abandon_install_job(job)
+                    return jsonify({"status": "error", "message": f"Unexpected error updating keyring: {e}"}), 500
     # ----------------------
 
-    # --- Prepare PTY and Command ---
+    # --- Prepare Command ---
     command = [
         "archinstall",
         "--config", config_path,
         "--creds", creds_path,
         "--json", # Output progress as JSON
-        "--log-file", "/tmp/archinstall_main.log", # Main log separate from progress
+        "--log-file", job['main_log_path'], # Main log separate from progress
+        "--mount-point", job['mount_point'], # Per-job mount point instead of /mnt/archinstall
         # "--silent" is now set within the config JSON
     ]
     print(f"DEBUG: Prepared archinstall command: {' '.join(command)}")
 
-    # Clean up old progress/stderr files before starting
-    if os.path.exists(progress_file_path):
-        os.remove(progress_file_path)
-    if os.path.exists(stderr_log_path):
-        os.remove(stderr_log_path)
-
+    # --- Start the job thread (prefetch -> archinstall in a PTY) ---
+    if job['state'] == 'killed':
+        # A newer request for the same disk replaced this one during the keyring refresh
+        abandon_install_job(job)
+        return jsonify({"status": "error", "message": f"Install job {job['id']} was replaced by a newer request for {target_device}"}), 409
     try:
-        # Create a pseudo-terminal (PTY)
-        master_fd, slave_fd = pty.openpty()
-        print(f"DEBUG: Opened PTY pair: master={master_fd}, slave={slave_fd}")
-
-        # Start the archinstall process, connecting its std* to the slave PTY
-        # Use preexec_fn=os.setsid to run in a new session, making it easier to kill later if needed
-        process = subprocess.Popen(
-            command,
-            stdin=slave_fd,
-            stdout=slave_fd,
-            stderr=slave_fd, # Redirect stderr to slave PTY as well
-            close_fds=True, # Close other inherited file descriptors
-            universal_newlines=False, # Read/write bytes with PTY
-            preexec_fn=os.setsid # Run in a new session
-        )
-        print(f"DEBUG: Started archinstall process with PID: {process.pid}")
-
-        # Close the slave FD in the parent process, it's only needed by the child (archinstall)
-        os.close(slave_fd)
-        print(f"DEBUG: Closed slave PTY fd {slave_fd} in parent.")
-
-        # Start the reader thread
-        reader_thread = threading.Thread(
-            target=read_pty_output,
-            args=(master_fd, progress_file_path, stderr_log_path), # Pass master FD and paths
+        os.makedirs(job['mount_point'], exist_ok=True)
+        job_thread = threading.Thread(
+            target=run_install_job,
+            args=(job, command, base_packages + config["packages"]),
             daemon=True # Allows main thread to exit even if this thread is running
         )
-        reader_thread.start()
-        print("DEBUG: Started PTY reader thread.")
+        job['thread'] = job_thread
+        job_thread.start()
+        print(f"DEBUG: Started install job thread for {job['id']}.")
 
-        # Store PID and thread info globally
-        install_process_info['pid'] = process.pid
-        install_process_info['thread'] = reader_thread
+        return jsonify({"status": "started", "job_id": job['id'], "device": job['device'], "mount_point": job['mount_point']})
 
-        return jsonify({"status": "started", "pid": process.pid})
-
-    except FileNotFoundError:
-        print("ERROR: archinstall command not found!")
-        # Ensure PTY FDs are closed if opened
-        if 'master_fd' in locals() and master_fd: os.close(master_fd)
-        if 'slave_fd' in locals() and slave_fd: os.close(slave_fd)
-        return jsonify({"status": "error", "message": "archinstall command not found"}), 500
     except Exception as e:
-        print(f"ERROR: Failed to start archinstall process: {e}")
-        # Ensure PTY FDs are closed on error
-        if 'master_fd' in locals() and master_fd: os.close(master_fd)
-        if 'slave_fd' in locals() and slave_fd: os.close(slave_fd)
+        print(f"ERROR: Failed to start install job {job['id']}: {e}")
+        abandon_install_job(job)
         return jsonify({"status": "error", "message": f"Failed to start installation: {e}"}), 500
 
 
 @app.route('/api/install/logs')
 def api_install_logs():
-    # Read RAW progress messages from the designated file
-    events = []
-    try:
-        if os.path.exists(progress_file_path):
-            with open(progress_file_path, 'r', encoding='utf-8') as f:
-                 file_content = f.read()
-                 # Split content into lines
-                 raw_lines = file_content.strip().split('\n')
-                 for line in raw_lines:
-                      line = line.strip()
-                      if line:
-                          # Send back simple message objects
-                          events.append({'message': line})
-
-    except FileNotFoundError:
-        print(f"WARN: Progress file {progress_file_path} not found yet.")
-        events.append({'message': 'Installation starting, waiting for output...'})
-    except Exception as e:
-        print(f"ERROR: Could not read progress file {progress_file_path}: {e}")
-        events.append({'message': f'Error reading progress log: {e}'})
-
+    """Raw progress lines of the most recently started job (used by Install.html)."""
+    with install_jobs_lock:
+        job = install_jobs.get(latest_job_id)
+    if job is None:
+        return jsonify([])
     # Return all collected lines as simple message objects
-    return jsonify(events)
+    return jsonify(read_progress_events(job['progress_path']))
+
+
+@app.route('/api/install/jobs')
+def api_install_jobs():
+    """Lists all install jobs started since the server came up."""
+    with install_jobs_lock:
+        jobs = [job_summary(job) for job in install_jobs.values()]
+    jobs.sort(key=lambda j: j['started_at'])
+    return jsonify({"jobs": jobs})
+
+
+@app.route('/api/install/jobs/<job_id>')
+def api_install_job_status(job_id):
+    """Returns the state of a single install job."""
+    with install_jobs_lock:
+        job = install_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Install job '{job_id}' not found."}), 404
+    return jsonify(job_summary(job))
+
+
+@app.route('/api/install/jobs/<job_id>/logs')
+def api_install_job_logs(job_id):
+    """Raw progress lines of a single install job."""
+    with install_jobs_lock:
+        job = install_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Install job '{job_id}' not found."}), 404
+    return jsonify(read_progress_events(job['progress_path']))
+
+
+@app.route('/api/install/jobs/<job_id>/downloads')
+def api_install_job_downloads(job_id):
+    """Per-package and total download progress of a single install job."""
+    with install_jobs_lock:
+        job = install_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Install job '{job_id}' not found."}), 404
+    return jsonify(job['downloads'].snapshot(include_packages=True))
+
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Operational metrics: job states and download throughput across all jobs."""
+    with install_jobs_lock:
+        jobs = list(install_jobs.values())
+    job_metrics = {}
+    total_bytes = 0
+    total_cache_bytes = 0
+    total_throughput = 0
+    for job in jobs:
+        downloads = job['downloads'].snapshot()
+        job_metrics[job['id']] = {'device': job['device'], 'state': job['state'], 'downloads': downloads}
+        total_bytes += downloads['downloaded_bytes']
+        total_cache_bytes += downloads['cache_served_bytes']
+        if job['state'] in ('downloading', 'installing') and downloads['throughput_bps']:
+            total_throughput += downloads['throughput_bps']
+    return jsonify({
+        'jobs': job_metrics,
+        'active_jobs': sum(1 for job in jobs if job['finished_at'] is None),
+        'downloaded_bytes': total_bytes,
+        'cache_served_bytes': total_cache_bytes,
+        'throughput_bps': total_throughput,
+    })
+
+
+@app.route('/api/install/jobs/<job_id>/cancel', methods=['POST'])
+def api_install_job_cancel(job_id):
+    """Kills a running install job."""
+    with install_jobs_lock:
+        job = install_jobs.get(job_id)
+        if job is not None:
+            stop_install_job(job)
+    if job is None:
+        return jsonify({"error": f"Install job '{job_id}' not found."}), 404
+    return jsonify(job_summary(job))
 
 
 @app.route('/api/install/debug_log')
@@ -638,9 +1033,8 @@ def api_install_debug_log():
     log_path = '/var/log/archinstall/install.log'
     lines = []
     try:
-        with open(log_path, 'r') as f:
-            # Efficiently get the last N lines
-            lines = deque(f, 100) 
+        # Read backwards from the end instead of scanning the whole file
+        lines = install_log.tail_text_file(log_path, 100)
     except FileNotFoundError:
         lines = [f"Error: Log file not found at {log_path}"]
     except Exception as e:
@@ -649,6 +1043,38 @@ def api_install_debug_log():
     # Return the lines as a single string with newlines
     return jsonify({'log_content': "\n".join(lines)})
 
+@app.route('/api/install/runs')
+def api_install_runs():
+    """Lists install runs with a structured log, including runs from earlier server sessions."""
+    return jsonify({"runs": install_log.list_runs(install_log_dir)})
+
+@app.route('/api/install/runs/<run_id>/log')
+def api_install_run_log(run_id):
+    """Queries a run's structured log.
+
+    Query parameters: tail=N (last N matches), since/until (unix timestamps),
+    level and phase (comma separated), limit (max entries when not tailing).
+    tail and limit are both capped at 10000 entries.
+    """
+    try:
+        reader = install_log.LogReader(install_log_dir, run_id)
+    except FileNotFoundError:
+        return jsonify({"error": f"No log found for run '{run_id}'.", "entries": []}), 404
+    try:
+        tail = request.args.get('tail', type=int)
+        if tail is not None:
+            tail = min(tail, 10000) # same cap as limit, so one response never holds the whole log
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+        limit = min(request.args.get('limit', 1000, type=int), 10000)
+        levels = [l for l in request.args.get('level', '').split(',') if l]
+        phases = [p for p in request.args.get('phase', '').split(',') if p]
+        entries = reader.query(tail=tail, since=since, until=until, levels=levels, phases=phases, limit=limit)
+    except Exception as e:
+        print(f"ERROR: Failed to query log for run {run_id}: {e}")
+        return jsonify({"error": str(e), "entries": []}), 500
+    return jsonify({"run_id": run_id, "total_entries": len(reader), "entries": entries})
+
 @app.route('/api/timezones')
 def api_timezone_regions():
     """Lists available timezone regions (continents/major areas)."""